@@ -0,0 +1,249 @@
+"""Tests for sentence generation and correction"""
+import re
+import sqlite3
+from typing import List, Tuple
+
+import pytest
+
+try:
+    import hassil  # noqa: F401
+except Exception as err:  # pylint: disable=broad-except
+    # hassil itself fails with a TypeError on older Pythons
+    pytest.skip(f"hassil is not usable: {err}", allow_module_level=True)
+
+pytest.importorskip("rapidfuzz")
+pytest.importorskip("yaml")
+
+# pylint: disable=wrong-import-position
+import yaml  # noqa: E402
+from hassil.intents import is_template  # noqa: E402
+
+from wyoming_vosk import sentences  # noqa: E402
+from wyoming_vosk.sentences import (  # noqa: E402
+    _CONFIG_CACHE,
+    _is_template,
+    _sample_templates_parallel,
+    correct_sentence,
+    generate_sentences,
+    load_sentences_for_language,
+)
+
+
+@pytest.fixture(autouse=True)
+def clear_config_cache():
+    """Configs are cached by language, so don't share them between tests."""
+    yield
+    for config in _CONFIG_CACHE.values():
+        config.close()
+
+    _CONFIG_CACHE.clear()
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "turn on the light",
+        "turn (on|off) the light",
+        "set {area} lights",
+        "[the] light",
+        "a|b",
+        "turn on\n(the) light",
+        "(turn on)\nthe light",
+        "",
+    ],
+)
+def test_is_template_matches_hassil(text: str) -> None:
+    assert _is_template(text) == is_template(text)
+
+
+def test_correct_sentence_output_text(tmp_path) -> None:
+    sentences_dir = tmp_path / "sentences"
+    sentences_dir.mkdir()
+    (sentences_dir / "en.yaml").write_text(
+        "\n".join(
+            [
+                "sentences:",
+                "  - turn on the light",
+                "  - in: red alert",
+                "    out: set light red",
+                "  - set light {color}",
+                "lists:",
+                "  color:",
+                "    values:",
+                "      - in: crimson",
+                "        out: red",
+            ]
+        ),
+        encoding="utf-8",
+    )
+
+    config = load_sentences_for_language(sentences_dir, "en", tmp_path / "db")
+    assert config is not None
+
+    # Output text is only stored when it differs from the input
+    with sqlite3.connect(str(config.database_path)) as db_conn:
+        rows = dict(db_conn.execute("SELECT input_text, output_text FROM sentences"))
+
+    assert rows == {
+        "turn on the light": None,
+        "red alert": "set light red",
+        "set light crimson": "set light red",
+    }
+
+    # Sentences that map to themselves
+    assert correct_sentence("turn on the light", config) == "turn on the light"
+    assert correct_sentence("turn of the light", config) == "turn on the light"
+
+    # Sentences with a different output
+    assert correct_sentence("red alert", config) == "set light red"
+    assert correct_sentence("set light crimsen", config) == "set light red"
+
+
+def test_parallel_sampling_matches_serial(monkeypatch) -> None:
+    sentences_yaml = {
+        "sentences": [
+            "turn (on|off) [the] {light}",
+            "literal sentence",
+            {"in": ["set {light} to {color}", "make {light} {color}"], "out": "set"},
+            "[please] <action> {light}",
+            {"in": "red alert", "out": "set light red"},
+            "what color is [the] {light}",
+            "(dim|brighten) {light}",
+            "{color} alert",
+        ],
+        "lists": {
+            "light": [
+                "lamp",
+                "desk light",
+                {"in": "(top|overhead) light", "out": "top"},
+            ],
+            "color": ["red", "green", "blue"],
+        },
+        "expansion_rules": {"action": "(turn|switch) (on|off)"},
+    }
+
+    def generate() -> List[Tuple[str, str]]:
+        db_conn = sqlite3.connect(":memory:")
+        db_conn.execute(
+            "CREATE TABLE sentences "
+            "(id INTEGER PRIMARY KEY AUTOINCREMENT, input_text TEXT, output_text TEXT);"
+        )
+        db_conn.execute(
+            "CREATE TABLE words "
+            "(id INTEGER PRIMARY KEY AUTOINCREMENT, word TEXT UNIQUE);"
+        )
+        generate_sentences(sentences_yaml, db_conn)
+        return list(
+            db_conn.execute("SELECT input_text, output_text FROM sentences ORDER BY id")
+        )
+
+    serial_rows = generate()
+
+    # Switch to worker processes after the first template, with more chunks
+    # than are allowed in flight
+    parallel_calls = []
+
+    def sample_templates_parallel(templates, *args, **kwargs):
+        parallel_calls.append(len(templates))
+        yield from _sample_templates_parallel(templates, *args, **kwargs)
+
+    monkeypatch.setattr(sentences, "_PARALLEL_MIN_SENTENCES", 1)
+    monkeypatch.setattr(sentences, "_PARALLEL_CHUNK_SIZE", 1)
+    monkeypatch.setattr(sentences.os, "cpu_count", lambda: 2)
+    monkeypatch.setattr(
+        sentences, "_sample_templates_parallel", sample_templates_parallel
+    )
+    parallel_rows = generate()
+
+    assert parallel_calls == [len(sentences_yaml["sentences"]) - 1]
+    assert parallel_rows == serial_rows
+
+
+def _load_no_correct_config(tmp_path, no_correct_patterns: List[str]):
+    sentences_dir = tmp_path / "sentences"
+    sentences_dir.mkdir()
+    (sentences_dir / "en.yaml").write_text(
+        yaml.safe_dump(
+            {
+                "sentences": ["turn on the light"],
+                "no_correct_patterns": no_correct_patterns,
+            }
+        ),
+        encoding="utf-8",
+    )
+
+    config = load_sentences_for_language(sentences_dir, "en", tmp_path / "db")
+    assert config is not None
+
+    return config
+
+
+def test_no_correct_patterns_re2(tmp_path) -> None:
+    re2 = pytest.importorskip("re2")
+    config = _load_no_correct_config(tmp_path, ["^what time", "^set (a|the) timer"])
+
+    assert isinstance(config.no_correct_union, type(re2.compile("")))
+    assert correct_sentence("what time is it", config) == "what time is it"
+    assert correct_sentence("set the timer", config) == "set the timer"
+    assert correct_sentence("turn of the light", config) == "turn on the light"
+
+
+@pytest.mark.parametrize("use_re2", [False, True])
+def test_no_correct_patterns_unicode_classes(tmp_path, monkeypatch, use_re2) -> None:
+    if use_re2:
+        pytest.importorskip("re2")
+    else:
+        monkeypatch.setattr(sentences, "re2", None)
+
+    # re2 only matches ASCII with \w and \s, so these must use re
+    config = _load_no_correct_config(tmp_path, [r"\w+ time", r"^stop\sit"])
+
+    assert isinstance(config.no_correct_union, re.Pattern)
+    assert correct_sentence("время time", config) == "время time"
+    assert correct_sentence("stop\xa0it", config) == "stop\xa0it"
+
+
+@pytest.mark.parametrize("use_re2", [False, True])
+@pytest.mark.parametrize(
+    ("no_correct_patterns", "re2_can_combine"),
+    [
+        # Global flags in re apply to the whole expression (or are an error)
+        pytest.param(["^what time", "(?i)^set a timer"], True, id="mid-pattern-flags"),
+        # re2 doesn't support verbose mode
+        pytest.param(
+            ["^what time", r"(?x) ^set \  a \  timer"], False, id="verbose-flag"
+        ),
+        # Group names must be unique in re
+        pytest.param(
+            ["^(?P<verb>what) time", "^(?P<verb>set) a timer"],
+            True,
+            id="duplicate-names",
+        ),
+        # Group numbers would shift in re, and re2 doesn't support backreferences
+        pytest.param(
+            ["^what time", r"^(set) a timer(?: \1)?$"], False, id="backreference"
+        ),
+    ],
+)
+def test_no_correct_patterns_fallback(
+    tmp_path, monkeypatch, use_re2, no_correct_patterns, re2_can_combine
+) -> None:
+    if use_re2:
+        re2 = pytest.importorskip("re2")
+    else:
+        monkeypatch.setattr(sentences, "re2", None)
+
+    config = _load_no_correct_config(tmp_path, no_correct_patterns)
+    if use_re2 and re2_can_combine:
+        assert isinstance(config.no_correct_union, type(re2.compile("")))
+    else:
+        # Patterns can't be combined, so they're matched one at a time
+        assert config.no_correct_union is None
+
+    assert correct_sentence("set a timer", config) == "set a timer"
+    assert correct_sentence("what time", config) == "what time"
+    assert correct_sentence("turn of the light", config) == "turn on the light"
+
+    # Flags from one pattern must not leak into the others
+    assert correct_sentence("WHAT TIME", config) == "turn on the light"
+    assert correct_sentence("whattime", config) == "turn on the light"
@@ -3,7 +3,6 @@ import argparse
 import asyncio
 import json
 import logging
-import sqlite3
 import sys
 import time
 from functools import partial
@@ -337,10 +336,9 @@ class VoskEventHandler(AsyncEventHandler):
             )
             if (lang_config is not None) and lang_config.database_path.is_file():
                 words: List[str] = []
-                with sqlite3.connect(str(lang_config.database_path)) as db_conn:
-                    cursor = db_conn.execute("SELECT word from WORDS")
-                    for row in cursor:
-                        words.append(row[0])
+                cursor = lang_config.get_db_conn().execute("SELECT word from WORDS")
+                for row in cursor:
+                    words.append(row[0])
 
                 casing_func_name = CASING_FOR_MODEL.get(
                     self.model_name,
@@ -1,14 +1,34 @@
 import argparse
 import itertools
 import logging
+import multiprocessing
+import os
 import re
 import sqlite3
+import sys
 import time
-from collections import abc
+from collections import abc, deque
+from concurrent.futures import Future, ProcessPoolExecutor
 from dataclasses import dataclass, field
 from functools import partial
 from pathlib import Path
-from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Set, Tuple, Union
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Tuple, Union
+
+try:
+    import yaml
+
+    # C loader is much faster, but requires PyYAML built with libyaml
+    _YAML_LOADER: Optional[Any] = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+except ImportError:
+    # Reported when sentences are loaded
+    yaml = None  # type: ignore
+    _YAML_LOADER = None
+
+try:
+    # Optional: linear-time matching for "no correct" patterns
+    import re2
+except ImportError:
+    re2 = None  # type: ignore
 
 if TYPE_CHECKING:
     from hassil.expression import Expression, Sentence
@@ -23,23 +43,103 @@ class LanguageConfig:
     sentences_file_size: int
     database_path: Path
     no_correct_patterns: List[re.Pattern] = field(default_factory=list)
+    no_correct_union: Optional[Any] = None  # re or re2 pattern
     unknown_text: Optional[str] = None
+    last_checked: float = 0.0
+    db_conn: Optional[sqlite3.Connection] = None
+
+    # Parallel lists of sentences for correction (loaded on first use)
+    input_texts: Optional[List[str]] = None
+    output_texts: Optional[List[str]] = None
+
+    def get_db_conn(self) -> sqlite3.Connection:
+        """Get connection to sentences database, opening it on first use."""
+        if self.db_conn is None:
+            self.db_conn = sqlite3.connect(
+                str(self.database_path),
+                check_same_thread=False,
+                cached_statements=256,
+            )
+
+        return self.db_conn
+
+    def get_sentences(self) -> Tuple[List[str], List[str]]:
+        """Get parallel input/output sentences, loading them from the database once."""
+        if (self.input_texts is None) or (self.output_texts is None):
+            self.input_texts = []
+            self.output_texts = []
+            for input_text, output_text in self.get_db_conn().execute(
+                "SELECT input_text, output_text from sentences"
+            ):
+                self.input_texts.append(input_text)
+                # NULL output means the same as input.
+                # Many inputs map to the same output, so only keep one copy.
+                self.output_texts.append(
+                    sys.intern(output_text) if output_text is not None else input_text
+                )
+
+        return (self.input_texts, self.output_texts)
+
+    def close(self) -> None:
+        """Close database connection and drop cached sentences."""
+        if self.db_conn is not None:
+            self.db_conn.close()
+            self.db_conn = None
+
+        self.input_texts = None
+        self.output_texts = None
 
 
 # language -> config
 _CONFIG_CACHE: Dict[str, LanguageConfig] = {}
 
+# Numbered or named backreference in a regex
+_BACKREF_RE = re.compile(r"\\[1-9]|\(\?P=")
+
+# Character classes that are ASCII-only in re2, but match Unicode in re
+_RE2_ASCII_CLASS_RE = re.compile(r"\\[wWdDsSbB]|\[:")
+
+# Template syntax characters (see _is_template)
+_TEMPLATE_RE = re.compile(r"[(){}<>\[\]|]")
+
+# Runs of whitespace, collapsed to a single space in generated sentences
+_WHITESPACE_RE = re.compile(r"\s+")
+
+# Remaining templates are only sampled in parallel after this many sentences.
+# Worker processes take a while to start (each re-imports hassil), so it's only
+# worth it for large files.
+_PARALLEL_MIN_SENTENCES = 100000
+
+# Templates sent to a worker at once (fewer round trips for small templates)
+_PARALLEL_CHUNK_SIZE = 8
+
+# (slot_lists, expansion_rules, expansion_cache, parsed_templates) in workers
+_WORKER_STATE: Optional[Tuple[Any, Any, Any, Any]] = None
+
+# Number of sentences to buffer before inserting into the database
+_INSERT_BATCH_SIZE = 10000
+
+# Seconds before checking the sentences file for changes again
+_SENTENCES_CHECK_SECONDS = 1.0
+
 
 def load_sentences_for_language(
     sentences_dir: Union[str, Path], language: str, database_dir: Union[str, Path]
 ) -> Optional[LanguageConfig]:
     """Load YAML file for language with sentence templates."""
+    config = _CONFIG_CACHE.get(language)
+    check_time = time.monotonic()
+    if (config is not None) and (
+        (check_time - config.last_checked) < _SENTENCES_CHECK_SECONDS
+    ):
+        # Checked very recently
+        return config
+
     sentences_path = Path(sentences_dir) / f"{language}.yaml"
     if not sentences_path.is_file():
         return None
 
     sentences_stats = sentences_path.stat()
-    config = _CONFIG_CACHE.get(language)
 
     # We will reload if the file modification time or size has changed
     if (
@@ -48,17 +148,16 @@ def load_sentences_for_language(
         and (sentences_stats.st_size == config.sentences_file_size)
     ):
         # Cache hit
+        config.last_checked = check_time
         return config
 
-    try:
-        import yaml
-    except ImportError as exc:
-        raise Exception("pip3 install wyoming-vosk[limited]") from exc
+    if yaml is None:
+        raise Exception("pip3 install wyoming-vosk[limited]")
 
     # Load and verify YAML
     _LOGGER.debug("Loading %s", sentences_path)
     with open(sentences_path, "r", encoding="utf-8") as sentences_file:
-        sentences_yaml = yaml.safe_load(sentences_file)
+        sentences_yaml = yaml.load(sentences_file, Loader=_YAML_LOADER)
         if not sentences_yaml:
             _LOGGER.warning("Empty YAML file: %s", sentences_path)
             return None
@@ -76,6 +175,7 @@ def load_sentences_for_language(
         sentences_mtime_ns=sentences_stats.st_mtime_ns,
         sentences_file_size=sentences_stats.st_size,
         database_path=database_path,
+        last_checked=check_time,
     )
 
     # Load "no correct" patterns
@@ -83,30 +183,74 @@ def load_sentences_for_language(
     for pattern_text in no_correct_patterns:
         config.no_correct_patterns.append(re.compile(pattern_text))
 
+    if no_correct_patterns:
+        config.no_correct_union = _compile_no_correct_union(config.no_correct_patterns)
+
     # Load text to use for unknown sentences
     config.unknown_text = sentences_yaml.get("unknown_text")
 
-    # Remove existing database
-    database_path.unlink(missing_ok=True)
-
-    # Create new database
-    db_conn = sqlite3.connect(str(database_path))
-    with db_conn:
-        db_conn.execute(
+    # Generate new database in memory, then write it to disk all at once
+    mem_conn = sqlite3.connect(":memory:")
+    mem_conn.execute("PRAGMA page_size=8192;")
+    with mem_conn:
+        mem_conn.execute(
             "CREATE TABLE sentences "
             + "(id INTEGER PRIMARY KEY AUTOINCREMENT, input_text TEXT, output_text TEXT);"
         )
-        db_conn.execute(
-            "CREATE TABLE words " + "(id INTEGER PRIMARY KEY AUTOINCREMENT, word TEXT);"
+        mem_conn.execute(
+            "CREATE TABLE words "
+            + "(id INTEGER PRIMARY KEY AUTOINCREMENT, word TEXT UNIQUE);"
         )
-        db_conn.commit()
-        generate_sentences(sentences_yaml, db_conn)
+        mem_conn.commit()
+        generate_sentences(sentences_yaml, mem_conn)
+
+    # Remove existing database
+    old_config = _CONFIG_CACHE.pop(language, None)
+    if old_config is not None:
+        old_config.close()
+
+    database_path.unlink(missing_ok=True)
+
+    db_conn = sqlite3.connect(str(database_path))
+    mem_conn.backup(db_conn)
+    db_conn.close()
+    mem_conn.close()
 
     _CONFIG_CACHE[language] = config
 
     return config
 
 
+def _compile_no_correct_union(patterns: List[re.Pattern]) -> Optional[Any]:
+    """Combine "no correct" patterns into a single pattern, using re2 if available."""
+    pattern_texts = [pattern.pattern for pattern in patterns]
+    union_text = "|".join(f"(?:{pattern_text})" for pattern_text in pattern_texts)
+
+    if (re2 is not None) and (not any(map(_RE2_ASCII_CLASS_RE.search, pattern_texts))):
+        # Matches in linear time, so bad patterns can't stall transcripts.
+        # Patterns with \w, \s, etc. use re so non-English transcripts still match.
+        try:
+            return re2.compile(union_text)
+        except re2.error:
+            _LOGGER.debug("Can't compile no_correct_patterns with re2, using re")
+
+    if any((pattern.flags & ~re.UNICODE) for pattern in patterns):
+        # Inline flags like (?i) apply to the whole expression in re, so they
+        # would leak into the other patterns.
+        return None
+
+    if any(map(_BACKREF_RE.search, pattern_texts)):
+        # Patterns with backreferences can't be combined since group numbers shift
+        return None
+
+    try:
+        return re.compile(union_text)
+    except re.error:
+        _LOGGER.debug("Can't combine no_correct_patterns, matching separately")
+
+    return None
+
+
 def generate_sentences(sentences_yaml: Dict[str, Any], db_conn: sqlite3.Connection):
     try:
         import hassil.parse_expression
@@ -133,6 +277,9 @@ def generate_sentences(sentences_yaml: Dict[str, Any], db_conn: sqlite3.Connecti
     #   <name>: sentence template
     templates = sentences_yaml["sentences"]
 
+    # Identical template text is only parsed once
+    parsed_templates: "Dict[str, Sentence]" = {}
+
     # Load slot lists
     slot_lists: Dict[str, SlotList] = {}
     for slot_name, slot_info in sentences_yaml.get("lists", {}).items():
@@ -157,8 +304,8 @@ def generate_sentences(sentences_yaml: Dict[str, Any], db_conn: sqlite3.Connecti
                 value_in = slot_value["in"]
                 value_out = slot_value["out"]
 
-                if hassil.intents.is_template(value_in):
-                    input_expression = hassil.parse_expression.parse_sentence(value_in)
+                if _is_template(value_in):
+                    input_expression = _parse_template(value_in, parsed_templates)
                     for input_text in hassil.sample.sample_expression(
                         input_expression,
                     ):
@@ -176,78 +323,283 @@ def generate_sentences(sentences_yaml: Dict[str, Any], db_conn: sqlite3.Connecti
     # Load expansion rules
     expansion_rules: Dict[str, hassil.Sentence] = {}
     for rule_name, rule_text in sentences_yaml.get("expansion_rules", {}).items():
-        expansion_rules[rule_name] = hassil.parse_sentence(rule_text)
+        expansion_rules[rule_name] = _parse_template(rule_text, parsed_templates)
 
     # Generate possible sentences
     num_sentences = 0
-    words: Set[str] = set()
-    for template in templates:
-        if isinstance(template, str):
-            input_templates: List[str] = [template]
-            output_text: Optional[str] = None
-        else:
-            input_str_or_list = template["in"]
-            if isinstance(input_str_or_list, str):
-                # One template
-                input_templates = [input_str_or_list]
-            else:
-                # Multiple templates
-                input_templates = input_str_or_list
+    sentences_batch: List[Tuple[str, str]] = []
+
+    def flush_sentences() -> None:
+        db_conn.executemany(
+            "INSERT INTO sentences (input_text, output_text) VALUES (?, ?)",
+            (
+                # Don't store output text when it's the same as input
+                (input_text, output_text if output_text != input_text else None)
+                for input_text, output_text in sentences_batch
+            ),
+        )
 
-            output_text = template.get("out")
+        # Words are de-duplicated per batch here, and across batches by the
+        # database. split() already strips whitespace.
+        batch_words = {
+            word
+            for input_text, _output_text in sentences_batch
+            for word in input_text.split()
+        }
+        db_conn.executemany(
+            "INSERT OR IGNORE INTO words (word) VALUES (?)",
+            ((word,) for word in batch_words),
+        )
 
-        for input_template in input_templates:
-            if hassil.intents.is_template(input_template):
-                # Generate possible texts
-                input_expression = hassil.parse_expression.parse_sentence(
-                    input_template
-                )
-                for input_text, maybe_output_text in sample_expression_with_output(
-                    input_expression,
-                    slot_lists=slot_lists,
-                    expansion_rules=expansion_rules,
-                ):
-                    db_conn.execute(
-                        "INSERT INTO sentences (input_text, output_text) VALUES (?, ?)",
-                        (input_text, output_text or maybe_output_text or input_text),
-                    )
-                    words.update(w.strip() for w in input_text.split())
-                    num_sentences += 1
-            else:
-                # Not a template
-                db_conn.execute(
-                    "INSERT INTO sentences (input_text, output_text) VALUES (?, ?)",
-                    (input_template, output_text or input_template),
-                )
-                words.update(w.strip() for w in input_template.split())
-                num_sentences += 1
+        sentences_batch.clear()
 
-        db_conn.commit()
+    template_sentences = _sample_templates(
+        templates, slot_lists, expansion_rules, parsed_templates
+    )
 
-    # Add words
-    for word in words:
-        db_conn.execute(
-            "INSERT INTO words (word) VALUES (?)",
-            (word,),
-        )
+    for template_sentence in template_sentences:
+        sentences_batch.append(template_sentence)
+        num_sentences += 1
+
+        if len(sentences_batch) >= _INSERT_BATCH_SIZE:
+            flush_sentences()
+
+    flush_sentences()
+    num_words = db_conn.execute("SELECT COUNT(*) FROM words").fetchone()[0]
 
+    # Everything is inserted in a single transaction
     db_conn.commit()
     end_time = time.monotonic()
 
     _LOGGER.info(
         "Generated %s sentence(s) with %s unique word(s) in %0.2f second(s)",
         num_sentences,
-        len(words),
+        num_words,
         end_time - start_time,
     )
 
 
+def _sample_templates(
+    templates: List[Union[str, Dict[str, Any]]],
+    slot_lists: "Dict[str, SlotList]",
+    expansion_rules: "Dict[str, Sentence]",
+    parsed_templates: "Dict[str, Sentence]",
+) -> Iterable[Tuple[str, str]]:
+    """Sample (input, output) text for all templates in order.
+
+    Templates are sampled in this process until many sentences have been
+    generated. The remaining templates are then sampled in worker processes if
+    enough of them have template syntax.
+    """
+    # Samples of {list} and <rule> references are shared across templates
+    expansion_cache: Dict[str, List[Tuple[str, Optional[str]]]] = {}
+    max_workers = os.cpu_count() or 1
+    num_sentences = 0
+
+    for template_index, template in enumerate(templates):
+        if (max_workers > 1) and (num_sentences >= _PARALLEL_MIN_SENTENCES):
+            remaining_templates = templates[template_index:]
+            num_workers = min(
+                max_workers,
+                sum(
+                    1
+                    for remaining_template in remaining_templates
+                    if any(map(_is_template, _get_input_templates(remaining_template)))
+                ),
+            )
+            if num_workers > 1:
+                yield from _sample_templates_parallel(
+                    remaining_templates, slot_lists, expansion_rules, num_workers
+                )
+                return
+
+            # Fewer templates left to expand from here on
+            max_workers = 1
+
+        for template_sentence in sample_template(
+            template,
+            slot_lists,
+            expansion_rules,
+            expansion_cache=expansion_cache,
+            parsed_templates=parsed_templates,
+        ):
+            yield template_sentence
+            num_sentences += 1
+
+
+def _get_input_templates(template: Union[str, Dict[str, Any]]) -> List[str]:
+    """Get input template text for a sentence template from YAML."""
+    if isinstance(template, str):
+        return [template]
+
+    input_str_or_list = template["in"]
+    if isinstance(input_str_or_list, str):
+        # One template
+        return [input_str_or_list]
+
+    # Multiple templates
+    return input_str_or_list
+
+
+def sample_template(
+    template: Union[str, Dict[str, Any]],
+    slot_lists: "Dict[str, SlotList]",
+    expansion_rules: "Dict[str, Sentence]",
+    expansion_cache: Optional[Dict[str, List[Tuple[str, Optional[str]]]]] = None,
+    parsed_templates: "Optional[Dict[str, Sentence]]" = None,
+) -> Iterable[Tuple[str, str]]:
+    """Sample (input, output) text for a sentence template from YAML."""
+    input_templates = _get_input_templates(template)
+    output_text: Optional[str] = None
+    if not isinstance(template, str):
+        output_text = template.get("out")
+
+    if parsed_templates is None:
+        parsed_templates = {}
+
+    for input_template in input_templates:
+        if _is_template(input_template):
+            # Generate possible texts
+            input_expression = _parse_template(input_template, parsed_templates)
+            for input_text, maybe_output_text in sample_expression_with_output(
+                input_expression,
+                slot_lists=slot_lists,
+                expansion_rules=expansion_rules,
+                expansion_cache=expansion_cache,
+            ):
+                yield (input_text, output_text or maybe_output_text or input_text)
+        else:
+            # Not a template
+            yield (input_template, output_text or input_template)
+
+
+def _sample_templates_parallel(
+    templates: List[Union[str, Dict[str, Any]]],
+    slot_lists: "Dict[str, SlotList]",
+    expansion_rules: "Dict[str, Sentence]",
+    num_workers: int,
+) -> Iterable[Tuple[str, str]]:
+    """Sample templates in worker processes, yielding sentences in order."""
+    # Only a few chunks are in flight at once. Finished chunks are held until
+    # they're consumed, so peak memory is about the sentences of
+    # (num_workers * 2 * _PARALLEL_CHUNK_SIZE) templates rather than the whole
+    # file if the database writer falls behind.
+    max_pending = num_workers * 2
+    pending: "deque[Future]" = deque()
+
+    # Don't fork the server process (threads, loaded models)
+    with ProcessPoolExecutor(
+        max_workers=num_workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_sample_worker,
+        initargs=(slot_lists, expansion_rules),
+    ) as executor:
+        for chunk_start in range(0, len(templates), _PARALLEL_CHUNK_SIZE):
+            chunk = templates[chunk_start : chunk_start + _PARALLEL_CHUNK_SIZE]
+            pending.append(executor.submit(_sample_templates_in_worker, chunk))
+
+            if len(pending) >= max_pending:
+                yield from pending.popleft().result()
+
+        while pending:
+            yield from pending.popleft().result()
+
+
+def _init_sample_worker(
+    slot_lists: "Dict[str, SlotList]", expansion_rules: "Dict[str, Sentence]"
+) -> None:
+    """Store lists and rules once per worker process."""
+    global _WORKER_STATE
+    _WORKER_STATE = (slot_lists, expansion_rules, {}, {})
+
+
+def _sample_templates_in_worker(
+    templates: List[Union[str, Dict[str, Any]]]
+) -> List[Tuple[str, str]]:
+    assert _WORKER_STATE is not None, "Worker not initialized"
+    slot_lists, expansion_rules, expansion_cache, parsed_templates = _WORKER_STATE
+    return [
+        sentence
+        for template in templates
+        for sentence in sample_template(
+            template,
+            slot_lists,
+            expansion_rules,
+            expansion_cache=expansion_cache,
+            parsed_templates=parsed_templates,
+        )
+    ]
+
+
+def _parse_template(
+    template_text: str, parsed_templates: "Dict[str, Sentence]"
+) -> "Sentence":
+    """Parse template text, re-using the result for identical text."""
+    from hassil.parse_expression import parse_sentence
+
+    parsed_template = parsed_templates.get(template_text)
+    if parsed_template is None:
+        parsed_template = parse_sentence(template_text)
+        parsed_templates[template_text] = parsed_template
+
+    return parsed_template
+
+
+def _is_template(text: str) -> bool:
+    """True if text contains template syntax (same as hassil.intents.is_template)."""
+    # hassil matches ".*[...].*", and "." stops at the first newline
+    line_end = text.find("\n")
+    if line_end < 0:
+        line_end = len(text)
+
+    return _TEMPLATE_RE.search(text, 0, line_end) is not None
+
+
 def sample_expression_with_output(
     expression: "Expression",
     slot_lists: "Optional[Dict[str, SlotList]]" = None,
     expansion_rules: "Optional[Dict[str, Sentence]]" = None,
+    expansion_cache: Optional[Dict[str, List[Tuple[str, Optional[str]]]]] = None,
+) -> Iterable[Tuple[str, Optional[str]]]:
+    """Sample possible text strings from an expression.
+
+    If expansion_cache is provided, the samples of each {list} and <rule> are
+    only generated once and replayed for every other reference to them.
+    """
+    from hassil.expression import ListReference, RuleReference
+
+    cache_key: Optional[str] = None
+    if expansion_cache is not None:
+        if isinstance(expression, ListReference):
+            cache_key = f"{{{expression.list_name}}}"
+        elif isinstance(expression, RuleReference):
+            cache_key = f"<{expression.rule_name}>"
+
+    if cache_key is None:
+        yield from _sample_expression_with_output(
+            expression, slot_lists, expansion_rules, expansion_cache
+        )
+        return
+
+    assert expansion_cache is not None
+    samples = expansion_cache.get(cache_key)
+    if samples is None:
+        samples = list(
+            _sample_expression_with_output(
+                expression, slot_lists, expansion_rules, expansion_cache
+            )
+        )
+        expansion_cache[cache_key] = samples
+
+    yield from samples
+
+
+def _sample_expression_with_output(
+    expression: "Expression",
+    slot_lists: "Optional[Dict[str, SlotList]]",
+    expansion_rules: "Optional[Dict[str, Sentence]]",
+    expansion_cache: Optional[Dict[str, List[Tuple[str, Optional[str]]]]],
 ) -> Iterable[Tuple[str, Optional[str]]]:
-    """Sample possible text strings from an expression."""
     from hassil.expression import (
         ListReference,
         RuleReference,
@@ -257,7 +609,6 @@ def sample_expression_with_output(
     )
     from hassil.intents import TextSlotList
     from hassil.recognize import MissingListError, MissingRuleError
-    from hassil.util import normalize_whitespace
 
     if isinstance(expression, TextChunk):
         chunk: TextChunk = expression
@@ -270,6 +621,7 @@ def sample_expression_with_output(
                     item,
                     slot_lists,
                     expansion_rules,
+                    expansion_cache,
                 )
         elif seq.type == SequenceType.GROUP:
             seq_sentences = map(
@@ -277,15 +629,19 @@ def sample_expression_with_output(
                     sample_expression_with_output,
                     slot_lists=slot_lists,
                     expansion_rules=expansion_rules,
+                    expansion_cache=expansion_cache,
                 ),
                 seq.items,
             )
             sentence_texts = itertools.product(*seq_sentences)
             for sentence_words in sentence_texts:
+                # Same as hassil's normalize_whitespace, without the extra call.
+                # Joining lists is faster than joining generators.
                 yield (
-                    normalize_whitespace("".join(w[0] for w in sentence_words)),
-                    normalize_whitespace(
-                        "".join(w[1] for w in sentence_words if w[1] is not None)
+                    _WHITESPACE_RE.sub(" ", "".join([w[0] for w in sentence_words])),
+                    _WHITESPACE_RE.sub(
+                        " ",
+                        "".join([w[1] for w in sentence_words if w[1] is not None]),
                     ),
                 )
         else:
@@ -311,6 +667,7 @@ def sample_expression_with_output(
                         text_value.text_in,
                         slot_lists,
                         expansion_rules,
+                        expansion_cache,
                     ):
                         if is_first_text:
                             output_text = (
@@ -328,6 +685,7 @@ def sample_expression_with_output(
                         text_value.text_in,
                         slot_lists,
                         expansion_rules,
+                        expansion_cache,
                     )
         else:
             raise ValueError(f"Unexpected slot list type: {slot_list}")
@@ -342,6 +700,7 @@ def sample_expression_with_output(
             rule_body,
             slot_lists,
             expansion_rules,
+            expansion_cache,
         )
     else:
         raise ValueError(f"Unexpected expression: {expression}")
@@ -356,37 +715,45 @@ def correct_sentence(
         return text
 
     # Don't correct transcripts that match a "no correct" pattern
-    for pattern in config.no_correct_patterns:
-        if pattern.match(text):
+    if config.no_correct_union is not None:
+        if config.no_correct_union.match(text):
             return text
+    else:
+        for pattern in config.no_correct_patterns:
+            if pattern.match(text):
+                return text
 
-    with sqlite3.connect(str(config.database_path)) as db_conn:
-        try:
-            from rapidfuzz.distance import Levenshtein
-            from rapidfuzz.process import extractOne
-        except ImportError as exc:
-            raise Exception("pip3 install wyoming-vosk[limited]") from exc
-
-        cursor = db_conn.execute("SELECT input_text, output_text from sentences")
-        result = extractOne(
-            [text],  # critical that this is a list
-            cursor,
-            processor=lambda s: s[0],
-            scorer=Levenshtein.distance,
-            scorer_kwargs={"weights": (1, 1, 3)},
-        )
-        fixed_row, score = result[0], result[1]
+    try:
+        from rapidfuzz.distance import Levenshtein
+        from rapidfuzz.process import extractOne
+    except ImportError as exc:
+        raise Exception("pip3 install wyoming-vosk[limited]") from exc
 
-        final_text = text
-        if (score_cutoff <= 0) or (score <= score_cutoff):
-            # Map to output text
-            final_text = fixed_row[1]
+    input_texts, output_texts = config.get_sentences()
+    if not input_texts:
+        return text
 
-        _LOGGER.debug(
-            "score=%s/%s, original=%s, final=%s", score, score_cutoff, text, final_text
-        )
+    # Integer cutoff lets rapidfuzz stop early on distant sentences
+    result = extractOne(
+        text,
+        input_texts,
+        scorer=Levenshtein.distance,
+        scorer_kwargs={"weights": (1, 1, 3)},
+        score_cutoff=int(score_cutoff) if score_cutoff > 0 else None,
+    )
+
+    final_text = text
+    score = None
+    if result is not None:
+        # (choice, score, index)
+        score = result[1]
+        final_text = output_texts[result[2]]
+
+    _LOGGER.debug(
+        "score=%s/%s, original=%s, final=%s", score, score_cutoff, text, final_text
+    )
 
-        return final_text
+    return final_text
 
 
 # -----------------------------------------------------------------------------